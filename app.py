@@ -1,27 +1,88 @@
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import time
-import json
 import tempfile
 import logging
-from datetime import datetime, date, timedelta, time as dtime
-from threading import Thread
+import logging.handlers
+import queue
+import atexit
+import hashlib
+import hmac
+import functools
+from bisect import bisect_left
+from datetime import datetime, date, timedelta, timezone, time as dtime
+from threading import Thread, Lock, BoundedSemaphore, Event
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 
 
 
 # ==================================================
 # OPTION CHAIN CACHE (RATE LIMIT PROTECTION)
 # ==================================================
-OPTION_CHAIN_CACHE = {
-    "expiry": None,
-    "spot": None,
-    "data": None,
-    "ts": 0
-}
+# expiry_str -> {"spot", "data", "ts"}; keyed per expiry so the entry and
+# rollover paths don't evict each other's chain
+OPTION_CHAIN_CACHE = {}
 
 OPTION_CHAIN_TTL = 3  # seconds
+# expiry_str -> Lock; one caller refreshes an expired chain, concurrent
+# callers (parallel rollover workers) wait and reuse its result
+OPTION_CHAIN_LOCKS = {}
 
+# Expiry list gets hit by every entry / rollover with the same answer; keep
+# it and fall back to the last good value if Dhan errors, rather than
+# reporting "no expiries". (Positions aren't cached: nothing reads them yet.)
+EXPIRY_CACHE = {}  # (underlying_id, segment) -> (expiries, ts)
+EXPIRY_TTL = 3600  # seconds, expiry list is static intra-day
+
+
+# ==================================================
+# DHAN HTTP SESSION (CONNECTION REUSE)
+# ==================================================
+# One pooled keep-alive session for every Dhan REST call, so order
+# placement / status polls don't pay a fresh TCP+TLS handshake each time.
+# Retry only covers idempotent methods (urllib3 default) — orders are never
+# re-sent automatically.
+DHAN_BASE_URL = "https://api.dhan.co/v2"
+DHAN_POSITIONS_URL = DHAN_BASE_URL + "/positions"
+DHAN_ORDERS_URL = DHAN_BASE_URL + "/orders"
+DHAN_EXPIRY_LIST_URL = DHAN_BASE_URL + "/optionchain/expirylist"
+DHAN_OPTION_CHAIN_URL = DHAN_BASE_URL + "/optionchain"
+
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.1,
+            status_forcelist=[502, 503, 504]
+        )
+    )
+)
+
+# Cap concurrent Dhan calls so bursts from the executor / observers don't
+# trip the broker rate limit; a 429 pauses new calls in that endpoint group.
+DHAN_MAX_IN_FLIGHT = 8
+DHAN_SEMAPHORE = BoundedSemaphore(DHAN_MAX_IN_FLIGHT)
+DHAN_RATE_LIMIT_BACKOFF = 1.0   # seconds, when no Retry-After is given
+# Monotonic deadline set on 429, per endpoint group: a throttle on the data
+# APIs (option chain, positions, status polls) must never hold back the
+# second leg of an entry / exit, and vice versa
+DHAN_BACKOFF_UNTIL = {"orders": 0.0, "data": 0.0}
+
+# Re-touch the pooled connection before Dhan's idle timeout drops it
+DHAN_KEEPALIVE_INTERVAL = 30    # seconds
+# Only ping around NSE trading hours (IST, Mon–Fri); idle otherwise
+IST = timezone(timedelta(hours=5, minutes=30))
+DHAN_KEEPALIVE_HOURS = (dtime(9, 0), dtime(15, 35))
 
 # ==================================================
 # ENTRY EXECUTION CONFIG
@@ -30,34 +91,72 @@ SPREAD_LIMIT = 20          # max bid-ask spread allowed
 RETRY_INTERVAL = 3        # seconds between retries
 MAX_WAIT_SECONDS = 20     # total wait before abort
 FALLBACK_OFFSETS = [0, 100, -100]  # strikes in 100s only
+ROLLOVER_WORKERS = 4      # systems rolled over concurrently
 
 # ==================================================
 # LOGGING
 # ==================================================
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s",
+# Request / worker threads only enqueue records; a single listener thread
+# owns the actual stdout write.
+LOG_QUEUE = queue.SimpleQueue()
+
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(
+    logging.Formatter("%(asctime)s | %(levelname)s | %(message)s")
 )
+
+LOG_LISTENER = logging.handlers.QueueListener(LOG_QUEUE, _log_stream)
+LOG_LISTENER.start()
+atexit.register(LOG_LISTENER.stop)
+
+_log_enqueue = logging.handlers.QueueHandler(LOG_QUEUE)
+_log_enqueue.setFormatter(logging.Formatter("%(message)s"))
+
+logging.basicConfig(level=logging.INFO, handlers=[_log_enqueue])
 log = logging.getLogger("DHAN_ENGINE")
 
 # ==================================================
 # APP & STATE
 # ==================================================
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    jsonify / request.json backed by orjson (bytes out, no str round-trip)
+    """
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=orjson.OPT_NON_STR_KEYS
+        ).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
-os.makedirs("/data", exist_ok=True)
-STATE_FILE = "/data/system_positions.json"
+# Webhook work (entry / exit / rollover) runs here so TradingView gets its
+# ack without waiting on Dhan round-trips.
+EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dhan-worker")
+
+DATA_DIR = os.getenv("DATA_DIR", "/data")   # persistent disk mount
+os.makedirs(DATA_DIR, exist_ok=True)
+STATE_FILE = os.path.join(DATA_DIR, "system_positions.json")
 SYSTEM_POSITIONS = {}
+PENDING_ENTRIES = {}      # system_id -> claim, entry queued / in progress
+STATE_LOCK = Lock()       # guards SYSTEM_POSITIONS mutation + state file write
+SYSTEM_LOCKS = {}         # system_id -> Lock, serializes exit / rollover work
 # 🔍 BOOT-TIME DISK CHECK (TEMPORARY DEBUG)
 log.info(f"[BOOT] STATE_FILE exists = {os.path.exists(STATE_FILE)}")
 log.info(f"[BOOT] STATE_FILE path = {STATE_FILE}")
 
 try:
-    files = os.listdir("/data")
+    files = os.listdir(DATA_DIR)
 except Exception as e:
     files = f"ERROR: {e}"
 
-log.info(f"[BOOT] Files in /data = {files}")
+log.info(f"[BOOT] Files in {DATA_DIR} = {files}")
 
 
 # ==================================================
@@ -67,49 +166,138 @@ def load_system_positions():
     if not os.path.exists(STATE_FILE):
         return {}
     try:
-        with open(STATE_FILE, "r") as f:
-            return json.load(f)
+        with open(STATE_FILE, "rb") as f:
+            return orjson.loads(f.read())
     except Exception:
         return {}
 
 def save_system_positions(state):
     tmp_path = STATE_FILE + ".tmp"
 
-    with open(tmp_path, "w") as f:
-        json.dump(state, f, indent=2)
+    with open(tmp_path, "wb") as f:
+        # OPT_NON_STR_KEYS: system_id comes from the alert and may be an
+        # int; coerce keys like json.dump did instead of failing every save
+        f.write(orjson.dumps(
+            state, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+        ))
+        # Data must be on disk before the rename, or a crash can leave
+        # an empty / truncated state file behind the new name
+        f.flush()
+        os.fsync(f.fileno())
 
     # Atomic replace on SAME filesystem
     os.replace(tmp_path, STATE_FILE)
 
+    # Persist the rename itself (directory entry)
+    dir_fd = os.open(os.path.dirname(STATE_FILE) or ".", os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
 
 def persist_system_state(system_id, state):
-    SYSTEM_POSITIONS[system_id] = state
-    save_system_positions(SYSTEM_POSITIONS)
+    with STATE_LOCK:
+        SYSTEM_POSITIONS[system_id] = state
+        save_system_positions(SYSTEM_POSITIONS)
     log.info(f"[STATE] Persisted {system_id}")
 
 def remove_system_state(system_id):
-    if system_id in SYSTEM_POSITIONS:
+    with STATE_LOCK:
+        if system_id not in SYSTEM_POSITIONS:
+            return
         del SYSTEM_POSITIONS[system_id]
         save_system_positions(SYSTEM_POSITIONS)
-        log.info(f"[STATE] Removed {system_id}")
+    log.info(f"[STATE] Removed {system_id}")
+
+def system_lock(system_id):
+    # dict.setdefault is atomic, so two threads always get the same Lock
+    return SYSTEM_LOCKS.setdefault(system_id, Lock())
 
 SYSTEM_POSITIONS = load_system_positions()
 
-def observe_order_status_async(order_id, tag="", polls=6, interval=1):
+# ==================================================
+# ORDER UPDATES (DHAN POSTBACK)
+# ==================================================
+ORDER_STATUS_CACHE = OrderedDict()   # orderId -> latest postback payload
+ORDER_STATUS_CACHE_MAX = 1000        # LRU bound for long-running workers
+ORDER_EVENTS = {}          # orderId -> Event, set on every postback
+ORDER_EVENTS_LOCK = Lock()
+
+# Status polls start fast (market orders usually fill in <1s) and back
+# off towards the observer's max_interval
+ORDER_POLL_FIRST_WAIT = 0.1   # seconds
+ORDER_POLL_BACKOFF = 1.5
+ORDER_POLL_MAX = 6            # REST polls per order when postbacks are silent
+
+def order_event(order_id):
+    order_id = str(order_id)
+    with ORDER_EVENTS_LOCK:
+        ev = ORDER_EVENTS.get(order_id)
+        if ev is None:
+            ev = ORDER_EVENTS[order_id] = Event()
+            if order_id in ORDER_STATUS_CACHE:
+                ev.set()   # postback beat the observer
+        return ev
+
+def record_order_update(order_id, payload):
+    with ORDER_EVENTS_LOCK:
+        ORDER_STATUS_CACHE[order_id] = payload
+        ORDER_STATUS_CACHE.move_to_end(order_id)
+        while len(ORDER_STATUS_CACHE) > ORDER_STATUS_CACHE_MAX:
+            ORDER_STATUS_CACHE.popitem(last=False)
+        ev = ORDER_EVENTS.get(order_id)
+    if ev:
+        ev.set()
+
+def observe_order_status_async(order_id, tag="", window=6, max_interval=1,
+                               max_polls=ORDER_POLL_MAX):
     def _poll():
-        for _ in range(polls):
-            time.sleep(interval)
-            status = get_order_status(order_id)
-            log.info(f"[ORDER][STATUS][OBSERVE][{tag}] orderId={order_id} status={status}")
+        ev = order_event(order_id)
+        deadline = time.monotonic() + window
+        wait = ORDER_POLL_FIRST_WAIT
+        polls = 0
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            # Postback wakes us immediately; only poll REST if it's silent
+            if ev.wait(min(wait, remaining)):
+                ev.clear()
+                update = ORDER_STATUS_CACHE.get(str(order_id)) or {}
+                status = update.get("orderStatus")
+                source = "POSTBACK"
+            elif polls < max_polls:
+                polls += 1
+                status = get_order_status(order_id)
+                source = "POLL"
+            else:
+                # REST budget spent; just listen for a postback until deadline
+                wait = remaining
+                continue
+            log.info(f"[ORDER][STATUS][OBSERVE][{tag}][{source}] orderId={order_id} status={status}")
             if status == "TRADED":
                 break   # ✅ stop early
+
+            wait = min(wait * ORDER_POLL_BACKOFF, max_interval)
+
+        with ORDER_EVENTS_LOCK:
+            ORDER_EVENTS.pop(str(order_id), None)
     Thread(target=_poll, daemon=True).start()
 
 
 # ==================================================
 # DHAN AUTH HELPERS
 # ==================================================
+DHAN_HEADERS = None   # built once from env on first use, then reused
+
 def dhan_headers():
+    global DHAN_HEADERS
+    if DHAN_HEADERS is not None:
+        return DHAN_HEADERS
+
     cid = os.getenv("DHAN_CLIENT_ID")
     token = os.getenv("DHAN_ACCESS_TOKEN")
 
@@ -117,21 +305,36 @@ def dhan_headers():
         log.critical("[AUTH] Missing Dhan credentials in environment")
         raise RuntimeError("Missing Dhan credentials")
 
-    return {
+    DHAN_HEADERS = {
         "access-token": token,
         "client-id": cid,
         "Content-Type": "application/json"
     }
+    return DHAN_HEADERS
+
+def refresh_dhan_headers(token):
+    """
+    Swap in a rotated access token. A running process never sees env
+    changes, so the new token has to be handed in explicitly
+    """
+    global DHAN_HEADERS
+    cid = os.getenv("DHAN_CLIENT_ID")
+    if not cid:
+        log.critical("[AUTH] Missing Dhan credentials in environment")
+        raise RuntimeError("Missing Dhan credentials")
+
+    DHAN_HEADERS = {
+        "access-token": token,
+        "client-id": cid,
+        "Content-Type": "application/json"
+    }
+    return DHAN_HEADERS
 
 
    
 def ensure_dhan_auth():
-    cid = os.getenv("DHAN_CLIENT_ID")
-    token = os.getenv("DHAN_ACCESS_TOKEN")
-
-    if not cid or not token:
-        log.critical("[AUTH] Missing Dhan credentials")
-        raise RuntimeError("Missing Dhan credentials")
+    # Check the token actually in use (may have been rotated via /reload-auth)
+    token = dhan_headers()["access-token"]
 
     if len(token) < 50:
         log.critical("[AUTH] Invalid / expired Dhan access token")
@@ -140,15 +343,82 @@ def ensure_dhan_auth():
     log.info("[AUTH] Dhan credentials present")
 
 
+def dhan_request(method, url, **kwargs):
+    """
+    Single entry point for Dhan REST calls: pooled SESSION, bounded
+    in-flight count, and a per-group pause after a 429
+    """
+    group = "orders" if method == "POST" and url == DHAN_ORDERS_URL else "data"
+
+    wait = DHAN_BACKOFF_UNTIL[group] - time.monotonic()
+    if wait > 0:
+        log.warning(f"[DHAN][THROTTLE] Backing off {wait:.2f}s before {url}")
+        time.sleep(wait)
+
+    with DHAN_SEMAPHORE:
+        r = SESSION.request(method, url, headers=dhan_headers(), **kwargs)
+
+    if r.status_code == 429:
+        try:
+            delay = float(r.headers.get("Retry-After", DHAN_RATE_LIMIT_BACKOFF))
+        except ValueError:
+            delay = DHAN_RATE_LIMIT_BACKOFF
+        DHAN_BACKOFF_UNTIL[group] = max(
+            DHAN_BACKOFF_UNTIL[group], time.monotonic() + delay
+        )
+        log.warning(f"[DHAN][429][{group}] Rate limited on {url}, pausing {delay}s")
+
+    return r
+
+
+def dhan_json(r):
+    """
+    Decode a Dhan response body straight from bytes with orjson
+    """
+    return orjson.loads(r.content)
+
+
+# ==================================================
+# CONNECTION WARM-UP
+# ==================================================
+def keep_dhan_connection_warm():
+    """
+    Keep the TCP+TLS connection open during market hours so the first
+    alert of the day doesn't pay the handshake
+    """
+    while True:
+        if within_keepalive_hours():
+            try:
+                SESSION.head(DHAN_BASE_URL, timeout=2)
+                log.debug("[DHAN][WARM] Connection refreshed")
+            except Exception as e:
+                log.warning(f"[DHAN][WARM] {e}")
+        time.sleep(DHAN_KEEPALIVE_INTERVAL)
+
+def within_keepalive_hours(now=None):
+    now = now or datetime.now(IST)
+    start, end = DHAN_KEEPALIVE_HOURS
+    return now.weekday() < 5 and start <= now.time() <= end
+
+def start_dhan_keepalive():
+    """
+    Started from gunicorn's post_worker_init hook, never at import
+    """
+    Thread(
+        target=keep_dhan_connection_warm,
+        name="dhan-keepalive",
+        daemon=True
+    ).start()
+
 
 # ==================================================
 # BROKER POSITIONS (REAL)
 # ==================================================
 def get_broker_positions():
     try:
-        r = requests.get(
-            "https://api.dhan.co/v2/positions",
-            headers=dhan_headers(),
+        r = dhan_request(
+            "GET",
+            DHAN_POSITIONS_URL,
             timeout=10
         )
         if not r.ok:
@@ -161,7 +431,7 @@ def get_broker_positions():
                 "error": r.text
             }
 
-        return r.json()
+        return dhan_json(r)
     except Exception as e:
         log.error(f"[BROKER][POSITIONS] {e}")
         return []
@@ -169,7 +439,7 @@ def get_broker_positions():
 def broker_has_position(security_id, qty):
     for p in get_broker_positions():
         if str(p.get("securityId")) == str(security_id):
-            return abs(int(p.get("netQty", 0))) >= qty
+            return abs(int(p.get("netQty") or 0)) >= qty
     return False
 
 # ==================================================
@@ -177,9 +447,9 @@ def broker_has_position(security_id, qty):
 # ==================================================
 def get_order_status(order_id):
     try:
-        r = requests.get(
-            f"https://api.dhan.co/v2/orders/{order_id}",
-            headers=dhan_headers(),
+        r = dhan_request(
+            "GET",
+            f"{DHAN_ORDERS_URL}/{order_id}",
             timeout=5
         )
 
@@ -187,7 +457,7 @@ def get_order_status(order_id):
             log.error(f"[ORDER][RESPONSE][{r.status_code}] {r.text}")
             return None
 
-        data = r.json()
+        data = dhan_json(r)
 
         if isinstance(data, list) and data:
             status = data[0].get("orderStatus")
@@ -208,28 +478,33 @@ def get_order_status(order_id):
 # ==================================================
 # ORDER PLACEMENT (REAL)
 # ==================================================
+# Only side / securityId / quantity vary per order — the rest of the
+# payload is serialized once here and filled in with %-formatting.
+ORDER_PAYLOAD_TEMPLATE = (
+    '{"dhanClientId":1101700964,'   # ❗ NO hardcoding
+    '"transactionType":"%s",'
+    '"exchangeSegment":"NSE_FNO",'
+    '"productType":"MARGIN",'
+    '"orderType":"MARKET",'
+    '"validity":"DAY",'
+    '"securityId":%d,'
+    '"quantity":%d,'
+    '"disclosedQuantity":0,'
+    '"afterMarketOrder":false}'
+)
+
+
 def place_order_with_checks(side, security_id, qty):
     try:
-        payload = {
-            "dhanClientId": 1101700964,   # ❗ NO hardcoding
-            "transactionType": side,
-            "exchangeSegment": "NSE_FNO",
-            "productType": "MARGIN",
-            "orderType": "MARKET",
-            "validity": "DAY",
-            "securityId": int(security_id),
-            "quantity": int(qty),
-            "disclosedQuantity": 0,
-            "afterMarketOrder": False
-        }
+        body = ORDER_PAYLOAD_TEMPLATE % (side, int(security_id), int(qty))
 
-        log.error("[ORDER][DEBUG][PAYLOAD] " + json.dumps(payload))
+        log.error("[ORDER][DEBUG][PAYLOAD] " + body)
 
-        r = requests.post(
-            "https://api.dhan.co/v2/orders",
-            headers=dhan_headers(),
-            json=payload,
-            timeout=10
+        r = dhan_request(
+            "POST",
+            DHAN_ORDERS_URL,
+            data=body.encode(),
+            timeout=(3, 10)   # connect, read
         )
 
         log.error(f"[ORDER][RESPONSE] status={r.status_code} body={r.text}")
@@ -253,7 +528,7 @@ def place_order_with_checks(side, security_id, qty):
                 "error": r.text
             }
 
-        data = r.json()
+        data = dhan_json(r)
         order_id = data.get("orderId")
 
         if not order_id:
@@ -286,87 +561,114 @@ def get_option_expiries(underlying_id, underlying_seg="IDX_I"):
     """
     Fetch list of valid expiries for the underlying from Dhan
     """
+    key = (str(underlying_id), underlying_seg)
+    cached = EXPIRY_CACHE.get(key)
+    if cached and time.monotonic() - cached[1] < EXPIRY_TTL:
+        return cached[0]
+    stale = cached[0] if cached else []
+
     try:
         payload = {
             "UnderlyingScrip": int(underlying_id),
             "UnderlyingSeg": underlying_seg
         }
 
-        url = "https://api.dhan.co/v2/optionchain/expirylist"
-        r = requests.post(
-            url,
-            headers=dhan_headers(),
+        r = dhan_request(
+            "POST",
+            DHAN_EXPIRY_LIST_URL,
             json=payload,
             timeout=10
         )
         if not r.ok:
-            log.error(f"[ORDER][RESPONSE][{r.status_code}] {r.text}")
-            return {"placed": False, "error": r.text}
+            log.error(f"[EXPIRY][RESPONSE][{r.status_code}] {r.text}")
+            return stale
 
-
-        resp = r.json()
+        resp = dhan_json(r)
 
         expiries = resp.get("data")
         if not isinstance(expiries, list) or not expiries:
             log.error(f"[EXPIRY] Invalid expiry response: {resp}")
-            return []
+            return stale
 
+        EXPIRY_CACHE[key] = (expiries, time.monotonic())
         log.info(f"[EXPIRY][LIST] {expiries}")
         return expiries
 
     except Exception as e:
         log.error(f"[EXPIRY][ERROR] {e}")
-        return []
+        return stale
+
+@functools.lru_cache(maxsize=64)
+def parse_expiry(expiry_str):
+    """
+    Expiry list is cached for 1h (EXPIRY_TTL) → same strings on every call
+    """
+    return date.fromisoformat(expiry_str)
 
 def get_monthly_expiries(expiries):
     """
-    Filters only MONTHLY expiries (last expiry of each month)
+    Filters only MONTHLY expiries (last expiry of each month).
+    Returns sorted dates — each string is parsed exactly once here
     """
     monthly = {}
     for e in expiries:
-        d = date.fromisoformat(e)
+        d = parse_expiry(e)
         key = (d.year, d.month)
-        monthly[key] = e  # last one wins
+        monthly[key] = d  # last one wins
 
     return sorted(monthly.values())
 
 def is_monthly_expiry_today(monthly_expiries):
-    today = date.today().isoformat()
-    return today in monthly_expiries
+    return date.today() in monthly_expiries
 
 def choose_entry_expiry(monthly_expiries):
     """
     If today is expiry → use next month
     Else → use current month
+    Returns the ISO string Dhan's option chain / state expect
     """
     today = date.today()
+    idx = bisect_left(monthly_expiries, today)
 
-    for e in monthly_expiries:
-        d = date.fromisoformat(e)
-        if d >= today:
-            if d == today:
-                idx = monthly_expiries.index(e)
-                return monthly_expiries[idx + 1]
-            return e
+    if idx == len(monthly_expiries):
+        return None
 
-    return None
+    if monthly_expiries[idx] == today:
+        # Expiry day on the last listed month → nothing to roll into yet
+        if idx + 1 == len(monthly_expiries):
+            return None
+        idx += 1
+    return monthly_expiries[idx].isoformat()
 
 
 
 
-def fetch_option_chain_for_expiry(expiry_str):
-    now = time.time()
+def cached_option_chain(expiry_str):
+    entry = OPTION_CHAIN_CACHE.get(expiry_str)
+    if entry and time.monotonic() - entry["ts"] < OPTION_CHAIN_TTL:
+        return entry
+    return None
 
+def fetch_option_chain_for_expiry(expiry_str):
     # --------------------------------------------------
     # ✅ RETURN CACHED DATA IF FRESH
     # --------------------------------------------------
-    if (
-        OPTION_CHAIN_CACHE["expiry"] == expiry_str
-        and now - OPTION_CHAIN_CACHE["ts"] < OPTION_CHAIN_TTL
-    ):
+    entry = cached_option_chain(expiry_str)
+    if entry:
         log.info("[CHAIN][CACHE] Using cached option chain")
-        return OPTION_CHAIN_CACHE["spot"], OPTION_CHAIN_CACHE["data"]
+        return entry["spot"], entry["data"]
 
+    # --------------------------------------------------
+    # 🔒 SINGLE-FLIGHT REFRESH (Dhan allows 1 chain req / 3s)
+    # --------------------------------------------------
+    with OPTION_CHAIN_LOCKS.setdefault(expiry_str, Lock()):
+        entry = cached_option_chain(expiry_str)
+        if entry:
+            log.info("[CHAIN][CACHE] Reusing chain refreshed by another caller")
+            return entry["spot"], entry["data"]
+        return refresh_option_chain(expiry_str)
+
+def refresh_option_chain(expiry_str):
     uid = os.getenv("NIFTY_UNDERLYING_ID")
     if not uid:
         log.error("[CONFIG] NIFTY_UNDERLYING_ID not set")
@@ -379,18 +681,17 @@ def fetch_option_chain_for_expiry(expiry_str):
     }
 
     try:
-        r = requests.post(
-            "https://api.dhan.co/v2/optionchain",
-            headers=dhan_headers(),
+        r = dhan_request(
+            "POST",
+            DHAN_OPTION_CHAIN_URL,
             json=payload,
             timeout=10
         )
         if not r.ok:
-            log.error(f"[ORDER][RESPONSE][{r.status_code}] {r.text}")
-            return {"placed": False, "error": r.text}
-
+            log.error(f"[CHAIN][RESPONSE][{r.status_code}] {r.text}")
+            return None, None
 
-        data = r.json().get("data", {})
+        data = dhan_json(r).get("data", {})
         oc = data.get("oc")
 
         if not isinstance(oc, dict) or not oc:
@@ -402,15 +703,30 @@ def fetch_option_chain_for_expiry(expiry_str):
             log.error("[CHAIN] Invalid spot price")
             return None, None
 
+        # --------------------------------------------------
+        # NORMALIZE STRIKE KEYS ONCE (Dhan uses '25900.000000')
+        # --------------------------------------------------
+        normalized_oc = {}
+
+        for k, v in oc.items():
+            try:
+                normalized_oc[int(round(float(k)))] = v
+            except Exception:
+                continue
+
+        oc = normalized_oc
+        if not oc:
+            log.error(f"[CHAIN] No usable strikes for expiry {expiry_str}")
+            return None, None
+
         # --------------------------------------------------
         # ✅ UPDATE CACHE
         # --------------------------------------------------
-        OPTION_CHAIN_CACHE.update({
-            "expiry": expiry_str,
+        OPTION_CHAIN_CACHE[expiry_str] = {
             "spot": spot,
             "data": oc,
-            "ts": time.time()
-        })
+            "ts": time.monotonic()
+        }
 
         log.info("[CHAIN][FETCH] Option chain refreshed from API")
         return spot, oc
@@ -455,7 +771,7 @@ def spread_ok(sd):
 def enter_synthetic(system_id, expiry, spot, qty):
 
     ensure_dhan_auth()
-    start_time = time.time()
+    deadline = time.monotonic() + MAX_WAIT_SECONDS
     base_strike = round(spot / 100) * 100
 
     log.info(f"[ENTER] Spot={spot:.2f} BaseStrike={base_strike}")
@@ -464,7 +780,7 @@ def enter_synthetic(system_id, expiry, spot, qty):
         strike = base_strike + offset
         log.info(f"[ENTER] Trying strike {strike}")
 
-        while time.time() - start_time <= MAX_WAIT_SECONDS:
+        while time.monotonic() <= deadline:
 
             # 🔹 Fetch option chain ONLY here
             spot, oc = fetch_option_chain_for_expiry(expiry)
@@ -472,26 +788,15 @@ def enter_synthetic(system_id, expiry, spot, qty):
                 log.warning("[ENTER] Option chain fetch failed, backing off")
                 time.sleep(RETRY_INTERVAL)
                 continue
-            # --------------------------------------------------
-            # NORMALIZE STRIKE KEYS (Dhan uses '25900.000000')
-            # --------------------------------------------------
-            normalized_oc = {}
-
-            for k, v in oc.items():
-                try:
-                    strike_int = int(round(float(k)))
-                    normalized_oc[strike_int] = v
-                except Exception:
-                    continue
 
-            oc = normalized_oc
-
-            if not spot or not oc:
-                log.warning("[ENTER] Option chain fetch failed, backing off")
-                time.sleep(RETRY_INTERVAL)
-                continue
+            # oc is keyed by int strike (normalized at fetch time)
             spot_100 = int(round(spot / 100) * 100)
-            nearby = sorted([s for s in oc.keys() if abs(s - spot_100) <= 500])
+            # NIFTY strikes step by 50 → probe the ±500 window directly
+            # instead of scanning + sorting the whole chain
+            nearby = [
+                s for s in range(spot_100 - 500, spot_100 + 501, 50)
+                if s in oc
+            ]
             log.info(f"[DEBUG][STRIKES][NEAR ATM] {nearby}")
 
             sd = oc.get(strike)
@@ -504,10 +809,8 @@ def enter_synthetic(system_id, expiry, spot, qty):
             pe = sd.get("pe")
 
             log.info(
-                f"[DEBUG][RAW][{system_id}] "
-                f"Strike={strike} "
-                f"CE={json.dumps(ce, indent=2)} "
-                f"PE={json.dumps(pe, indent=2)}"
+                "[DEBUG][RAW][%s] Strike=%s CE=%s PE=%s",
+                system_id, strike, ce, pe
             )
 
             # Continue normal checks
@@ -577,10 +880,27 @@ def enter_synthetic(system_id, expiry, spot, qty):
     log.warning("[ENTER][ABORT] No strike met spread criteria. No trade.")
     return None
     
-def delayed_enter_synthetic(system_id, expiry, spot, qty):
+def delayed_enter_synthetic(system_id, underlying_id, qty):
     try:
         log.info(f"[ENTER][ASYNC][START] {system_id}")
 
+        expiries = get_option_expiries(underlying_id)
+        monthly = get_monthly_expiries(expiries)
+
+        if not monthly:
+            log.error(f"[ENTER][ABORT][{system_id}] No monthly expiries")
+            return
+
+        expiry = choose_entry_expiry(monthly)
+        if not expiry:
+            log.error(f"[ENTER][ABORT][{system_id}] No valid entry expiry")
+            return
+
+        spot, _ = fetch_option_chain_for_expiry(expiry)
+        if not spot:
+            log.error(f"[ENTER][ABORT][{system_id}] Spot fetch failed")
+            return
+
         state = enter_synthetic(system_id, expiry, spot, qty)
 
         if state:
@@ -595,11 +915,11 @@ def delayed_enter_synthetic(system_id, expiry, spot, qty):
             log.info(f"[STATE][VERIFY] STATE_FILE exists = {os.path.exists(STATE_FILE)}")
 
             try:
-                files = os.listdir("/data")
+                files = os.listdir(DATA_DIR)
             except Exception as e:
                 files = f"ERROR: {e}"
 
-            log.info(f"[STATE][VERIFY] Files in /data = {files}")
+            log.info(f"[STATE][VERIFY] Files in {DATA_DIR} = {files}")
 
             log.info(f"[ENTER][DONE] {system_id}")
 
@@ -609,6 +929,9 @@ def delayed_enter_synthetic(system_id, expiry, spot, qty):
     except Exception as e:
         log.exception(f"[ENTER][ERROR][{system_id}]")
 
+    finally:
+        PENDING_ENTRIES.pop(system_id, None)
+
 
 
 def exit_synthetic(system_id, state):
@@ -644,6 +967,35 @@ def exit_synthetic(system_id, state):
     return True
 
 
+def delayed_exit_synthetic(system_id):
+    try:
+        with system_lock(system_id):
+            # Re-read under the lock: a duplicate EXIT or the rollover may
+            # already have closed / replaced this position
+            state = SYSTEM_POSITIONS.get(system_id)
+            if not state:
+                log.warning(f"[EXIT][IGNORED] {system_id} already closed")
+                return
+
+            log.info(f"[EXIT][ASYNC][START] {system_id}")
+
+            if exit_synthetic(system_id, state):
+                remove_system_state(system_id)
+                log.info(f"[EXIT][SUCCESS] {system_id} closed and state cleared")
+            else:
+                log.error(f"[EXIT][FAILED] {system_id} exit failed")
+
+    except Exception:
+        log.exception(f"[EXIT][ERROR][{system_id}]")
+
+
+def delayed_handle_rollover():
+    try:
+        handle_rollover()
+    except Exception:
+        log.exception("[ROLLOVER][ERROR]")
+
+
 def handle_rollover():
     underlying_id = int(os.getenv("NIFTY_UNDERLYING_ID"))
     expiries = get_option_expiries(underlying_id)
@@ -657,58 +1009,192 @@ def handle_rollover():
         log.error("[ROLLOVER] No next monthly expiry")
         return
 
-    for system_id, state in list(SYSTEM_POSITIONS.items()):
-        if state["expiry"] != date.today().isoformat():
-            continue
+    today = date.today().isoformat()
+    with STATE_LOCK:
+        due = [
+            (system_id, state)
+            for system_id, state in SYSTEM_POSITIONS.items()
+            if state["expiry"] == today
+        ]
+    if not due:
+        return
+
+    # Fetch the next-month chain once up front: warms the cache every
+    # worker reads from, and if Dhan can't serve it we keep today's
+    # positions instead of exiting them with nothing to roll into
+    spot, oc = fetch_option_chain_for_expiry(next_expiry)
+    if not spot or not oc:
+        log.error(f"[ROLLOVER][ABORT] No option chain for {next_expiry}, positions kept")
+        return
+
+    # Systems are independent → roll them over in parallel
+    with ThreadPoolExecutor(
+        max_workers=ROLLOVER_WORKERS,
+        thread_name_prefix="rollover"
+    ) as pool:
+        for system_id, state in due:
+            pool.submit(rollover_system, system_id, state, next_expiry)
+
+
+def rollover_system(system_id, state, next_expiry):
+    try:
+        with system_lock(system_id):
+            if SYSTEM_POSITIONS.get(system_id) is not state:
+                log.warning(f"[ROLLOVER][SKIP] {system_id} changed since snapshot")
+                return
+
+            if not exit_synthetic(system_id, state):
+                log.error(f"[ROLLOVER] Exit failed for {system_id}")
+                return
+
+            spot, oc = fetch_option_chain_for_expiry(next_expiry)
+            if not spot or not oc:
+                log.error(f"[ROLLOVER] Failed to fetch chain for {system_id}")
+                return
+
+            new_state = enter_synthetic(
+                system_id, next_expiry, spot, state["qty"]
+            )
 
-        if not exit_synthetic(system_id, state):
-            log.error(f"[ROLLOVER] Exit failed for {system_id}")
-            continue
 
-        spot, oc = fetch_option_chain_for_expiry(next_expiry)
-        if not spot or not oc:
-            log.error(f"[ROLLOVER] Failed to fetch chain for {system_id}")
-            continue
+            if new_state:
+                persist_system_state(system_id, new_state)
+            else:
+                log.error(f"[ROLLOVER] Re-entry failed for {system_id}")
+                remove_system_state(system_id)
 
-        new_state = enter_synthetic(
-            system_id, next_expiry, spot, state["qty"]
+    except Exception:
+        log.exception(f"[ROLLOVER][ERROR][{system_id}]")
+
+
+# ==================================================
+# WEBHOOK AUTH
+# ==================================================
+# Shared secret for inbound calls. TradingView can't set custom headers,
+# so either an HMAC-SHA256 of the raw body in X-Signature or ?token=<secret>
+# on the configured webhook URL is accepted. Unset → open (legacy).
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").encode()
+
+if not WEBHOOK_SECRET:
+    log.warning("[AUTH] WEBHOOK_SECRET not set — inbound webhooks are unauthenticated")
+
+def webhook_authorized(raw):
+    """
+    Checked on raw bytes, before any JSON parsing
+    """
+    if not WEBHOOK_SECRET:
+        return True
+
+    sig = request.headers.get("X-Signature")
+    if sig:
+        expected = hmac.new(WEBHOOK_SECRET, raw, hashlib.sha256).hexdigest()
+        # Compare bytes: compare_digest raises on non-ASCII str (→ 500)
+        return hmac.compare_digest(
+            sig.encode("latin-1", "replace"), expected.encode()
         )
 
+    token = request.args.get("token", "")
+    return hmac.compare_digest(token.encode(), WEBHOOK_SECRET)
+
 
-        if new_state:
-            persist_system_state(system_id, new_state)
+# ==================================================
+# ALERT IDEMPOTENCY (TRADINGVIEW RETRIES)
+# ==================================================
+ALERT_DEDUPE = {}          # key -> [expires_at (monotonic), (body, status) | None]
+ALERT_DEDUPE_TTL = 60      # seconds
+ALERT_DEDUPE_LOCK = Lock()
+ALERT_IN_FLIGHT = ({"status": "duplicate"}, 200)
+# Only these make two identical-looking alerts distinguishable. TradingView
+# bodies are otherwise static, so deduping on the raw body would drop a
+# legitimate BUY → SELL → BUY within the TTL
+ALERT_UNIQUE_FIELDS = ("alert_id", "bar_time", "timenow")
+
+def alert_dedupe_key(data):
+    """
+    None when the alert carries no unique field → dispatch without dedupe
+    (PENDING_ENTRIES / SYSTEM_POSITIONS still guard double entries)
+    """
+    for field in ALERT_UNIQUE_FIELDS:
+        value = data.get(field)
+        if value:
+            src = f"{field}|{value}|{data.get('signal')}|{data.get('system_id')}"
+            return hashlib.blake2b(src.encode(), digest_size=16).hexdigest()
+    return None
+
+def claim_alert(key):
+    """
+    SETNX-style claim. Returns None for the first caller within the TTL,
+    otherwise the (body, status) to replay
+    """
+    now = time.monotonic()
+    with ALERT_DEDUPE_LOCK:
+        expired = [k for k, (exp, _) in ALERT_DEDUPE.items() if exp <= now]
+        for k in expired:
+            del ALERT_DEDUPE[k]
+
+        entry = ALERT_DEDUPE.get(key)
+        if entry:
+            return entry[1] or ALERT_IN_FLIGHT
+
+        ALERT_DEDUPE[key] = [now + ALERT_DEDUPE_TTL, None]
+        return None
+
+def remember_alert_response(key, body, status):
+    """
+    Cache accepted responses for replay; release the key on errors so a
+    retry after the fix is processed normally
+    """
+    with ALERT_DEDUPE_LOCK:
+        if status < 300:
+            if key in ALERT_DEDUPE:
+                ALERT_DEDUPE[key][1] = (body, status)
         else:
-            log.error(f"[ROLLOVER] Re-entry failed for {system_id}")
-            remove_system_state(system_id)
+            ALERT_DEDUPE.pop(key, None)
 
 
 # ==================================================
 # WEBHOOK
 # ==================================================
-@app.route("/tv-webhook", methods=["POST"])
-def tv_webhook():
-    data = request.json or {}
+EXIT_SIGNALS = frozenset(("SELL", "EXIT"))
 
-    signal = str(data.get("signal", "")).upper()
-    system_id = data.get("system_id")
-    underlying = data.get("underlying", "NIFTY")
-    qty = int(data.get("qty", 0))
+def parse_alert(data):
+    """
+    Validate a TradingView alert in one pass.
+    Returns (signal, system_id, qty, error) — error is None when valid.
+    """
+    if not isinstance(data, dict):
+        return None, None, 0, "Payload must be a JSON object"
 
-    # -------------------------------
-    # QTY VALIDATION
-    # -------------------------------
-    qty = int(data.get("qty", 0))
+    signal = data.get("signal")
+    signal = signal.upper() if isinstance(signal, str) else ""
+
+    try:
+        qty = int(data.get("qty", 0))
+    except (TypeError, ValueError):
+        qty = 0
 
     if qty <= 0:
-        return jsonify({"error": "Invalid qty. Must be > 0"}), 400
+        return signal, None, 0, "Invalid qty. Must be > 0"
 
+    # system_id keys PENDING_ENTRIES / SYSTEM_LOCKS / SYSTEM_POSITIONS
+    system_id = data.get("system_id")
+    if signal == "BUY" or signal in EXIT_SIGNALS:
+        if not isinstance(system_id, str) or not system_id.strip():
+            return signal, None, qty, "Invalid system_id. Must be a non-empty string"
+
+    return signal, system_id, qty, None
 
+
+def dispatch_alert(signal, system_id, qty):
+    """
+    Route a validated alert. Returns (body, status)
+    """
     # -------------------------------
     # ROLLOVER CHECK
     # -------------------------------
     if signal == "CHECK":
-        handle_rollover()
-        return jsonify({"status": "checked"}), 200
+        EXECUTOR.submit(delayed_handle_rollover)
+        return {"status": "check_processing"}, 202
 
     # -------------------------------
     # BUY SIGNAL
@@ -716,75 +1202,150 @@ def tv_webhook():
     if signal == "BUY":
 
         # 🔒 DUPLICATE POSITION PROTECTION
+        # Claim the slot first with an atomic setdefault (no check-then-set
+        # gap between concurrent BUYs), then check for an open position.
+        claim = object()
+        if PENDING_ENTRIES.setdefault(system_id, claim) is not claim:
+            log.warning(f"[BUY][DUPLICATE] {system_id} entry already in progress")
+            return {"error": "Entry already in progress"}, 409
+
         if system_id in SYSTEM_POSITIONS:
+            PENDING_ENTRIES.pop(system_id, None)
             log.warning(f"[BUY][DUPLICATE] {system_id} already has open position")
-            return jsonify({"error": "Position already open"}), 409
+            return {"error": "Position already open"}, 409
 
         uid = os.getenv("NIFTY_UNDERLYING_ID")
         if not uid:
-            return jsonify({"error": "NIFTY_UNDERLYING_ID not set"}), 500
+            PENDING_ENTRIES.pop(system_id, None)
+            return {"error": "NIFTY_UNDERLYING_ID not set"}, 500
 
-        underlying_id = int(uid)
+        EXECUTOR.submit(delayed_enter_synthetic, system_id, int(uid), qty)
 
-        expiries = get_option_expiries(underlying_id)
-        monthly = get_monthly_expiries(expiries)
-
-        if not monthly:
-            return jsonify({"error": "No monthly expiries"}), 400
-
-        expiry = choose_entry_expiry(monthly)
-        if not expiry:
-            return jsonify({"error": "No valid entry expiry"}), 400
-
-        spot, _ = fetch_option_chain_for_expiry(expiry)
-        if not spot:
-            return jsonify({"error": "Spot fetch failed"}), 500
-
-
-        Thread(
-            target=delayed_enter_synthetic,
-            args=(system_id, expiry, spot, qty),
-            daemon=True
-        ).start()
-
-        return jsonify({"status": "entry_processing"}), 200
+        return {"status": "entry_processing"}, 202
 
 
     # -------------------------------
     # SELL / EXIT SIGNAL
     # -------------------------------
-    if signal in ("SELL", "EXIT"):
+    if signal in EXIT_SIGNALS:
         log.info(f"[SIGNAL][EXIT] {system_id}")
 
         if system_id not in SYSTEM_POSITIONS:
             log.warning(f"[EXIT][IGNORED] {system_id} not found")
-            return jsonify({"status": "ignored"}), 200
+            return {"status": "ignored"}, 200
+
+        EXECUTOR.submit(delayed_exit_synthetic, system_id)
+
+        return {"status": "exit_processing"}, 202
+
+    # -------------------------------
+    # UNKNOWN SIGNAL
+    # -------------------------------
+    return {"status": "ignored"}, 200
 
-        state = SYSTEM_POSITIONS[system_id]
 
-        exited = exit_synthetic(system_id, state)
+@app.route("/tv-webhook", methods=["POST"])
+def tv_webhook():
+    raw = request.get_data()
+    if not webhook_authorized(raw):
+        return jsonify({"error": "Unauthorized"}), 401
 
-        if exited:
-            remove_system_state(system_id)
-            log.info(f"[EXIT][SUCCESS] {system_id} closed and state cleared")
-            return jsonify({"status": "exited"}), 200
+    try:
+        data = orjson.loads(raw) if raw else {}
+    except orjson.JSONDecodeError:
+        return jsonify({"error": "Invalid JSON"}), 400
 
-        log.error(f"[EXIT][FAILED] {system_id} exit failed")
-        return jsonify({"status": "exit_failed"}), 500
+    # -------------------------------
+    # ALERT VALIDATION
+    # -------------------------------
+    signal, system_id, qty, error = parse_alert(data or {})
+    if error:
+        return jsonify({"error": error}), 400
 
     # -------------------------------
-    # UNKNOWN SIGNAL
+    # DUPLICATE ALERT (TV RETRY)
     # -------------------------------
-    return jsonify({"status": "ignored"}), 200
+    key = alert_dedupe_key(data)
+    if key is None:
+        body, status = dispatch_alert(signal, system_id, qty)
+        return jsonify(body), status
+
+    replay = claim_alert(key)
+    if replay is not None:
+        log.warning(f"[WEBHOOK][DUPLICATE] {signal} {system_id} replayed")
+        body, status = replay
+        return jsonify(body), status
+
+    body, status = dispatch_alert(signal, system_id, qty)
+    remember_alert_response(key, body, status)
+    return jsonify(body), status
+
+# ==================================================
+# DHAN POSTBACK (ORDER UPDATES)
+# ==================================================
+@app.route("/dhan-postback", methods=["POST"])
+def dhan_postback():
+    raw = request.get_data()
+    if not webhook_authorized(raw):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        data = orjson.loads(raw) if raw else {}
+    except orjson.JSONDecodeError:
+        return jsonify({"error": "Invalid JSON"}), 400
+
+    order_id = data.get("orderId") if isinstance(data, dict) else None
+    if not order_id:
+        return jsonify({"status": "ignored"}), 200
+
+    record_order_update(str(order_id), data)
+    log.info(f"[POSTBACK] orderId={order_id} status={data.get('orderStatus')}")
+    return jsonify({"status": "ok"}), 200
+
+# ==================================================
+# AUTH RELOAD
+# ==================================================
+@app.route("/reload-auth", methods=["POST"])
+def reload_auth():
+    """
+    Body: {"access_token": "<new token>"}. Without WEBHOOK_SECRET the
+    route is disabled — restart with the new DHAN_ACCESS_TOKEN instead
+    """
+    if not WEBHOOK_SECRET:
+        return jsonify({"error": "Disabled: WEBHOOK_SECRET not set"}), 403
+
+    raw = request.get_data()
+    if not webhook_authorized(raw):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        data = orjson.loads(raw) if raw else {}
+    except orjson.JSONDecodeError:
+        return jsonify({"error": "Invalid JSON"}), 400
+
+    token = data.get("access_token") if isinstance(data, dict) else None
+    if not isinstance(token, str) or len(token) < 50:
+        return jsonify({"error": "Invalid access_token"}), 400
+
+    try:
+        refresh_dhan_headers(token)
+    except RuntimeError as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+    log.info("[AUTH] Dhan access token rotated")
+    return jsonify({"ok": True}), 200
 
 # ==================================================
 # system_positions.json
 # ==================================================
 @app.route("/debug/state", methods=["GET"])
 def debug_state():
+    with STATE_LOCK:
+        systems = dict(SYSTEM_POSITIONS)
+
     return jsonify({
-        "systems": SYSTEM_POSITIONS,
-        "count": len(SYSTEM_POSITIONS)
+        "systems": systems,
+        "count": len(systems)
     })
 
 
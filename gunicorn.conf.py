@@ -0,0 +1,31 @@
+# gunicorn -c gunicorn.conf.py app:app   (picked up automatically from CWD)
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
+
+# gevent worker monkey-patches socket/ssl/time before app import, so the
+# blocking Dhan calls and retry sleeps yield instead of pinning the worker.
+worker_class = "gevent"
+worker_connections = 1000
+
+# SYSTEM_POSITIONS lives in process memory — keep a SINGLE worker so the
+# duplicate-position guard and state file have one owner.
+workers = 1
+
+# Import app inside the worker, never in the master: SESSION's pooled
+# sockets, EXECUTOR, the log listener and the warm-up thread must not be
+# created before fork.
+preload_app = False
+
+timeout = 60
+
+# Hold idle client connections open so the platform's TLS-terminating
+# proxy can keep reusing them instead of reconnecting per alert.
+keepalive = 75
+
+
+def post_worker_init(worker):
+    # The app module is already imported in the worker by now; start the
+    # Dhan connection warm-up here rather than as an import side effect.
+    from app import start_dhan_keepalive
+    start_dhan_keepalive()
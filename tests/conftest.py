@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Runs before any test module imports app: make the repo root importable
+# and keep state off the real /data disk.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="dhanwebhook-test-"))
+os.environ.setdefault("NIFTY_UNDERLYING_ID", "13")
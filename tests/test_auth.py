@@ -0,0 +1,47 @@
+import hashlib
+import hmac
+
+import orjson
+
+import app as engine
+
+NEW_TOKEN = "t" * 64
+
+
+def signed(body, secret=b"s3cret"):
+    return {"X-Signature": hmac.new(secret, body, hashlib.sha256).hexdigest()}
+
+
+def test_reload_auth_disabled_without_secret(monkeypatch):
+    monkeypatch.setattr(engine, "WEBHOOK_SECRET", b"")
+    client = engine.app.test_client()
+
+    r = client.post("/reload-auth", json={"access_token": NEW_TOKEN})
+    assert r.status_code == 403
+
+
+def test_reload_auth_rotates_token_from_body(monkeypatch):
+    monkeypatch.setattr(engine, "WEBHOOK_SECRET", b"s3cret")
+    monkeypatch.setattr(engine, "DHAN_HEADERS", None)
+    monkeypatch.setenv("DHAN_CLIENT_ID", "1101700964")
+    client = engine.app.test_client()
+
+    body = orjson.dumps({"access_token": NEW_TOKEN})
+    r = client.post("/reload-auth", data=body, headers=signed(body))
+    assert r.status_code == 200
+    assert engine.dhan_headers()["access-token"] == NEW_TOKEN
+
+    r = client.post("/reload-auth", data=body, headers=signed(body, b"wrong"))
+    assert r.status_code == 401
+
+
+def test_non_ascii_signature_is_rejected_not_500(monkeypatch):
+    monkeypatch.setattr(engine, "WEBHOOK_SECRET", b"s3cret")
+    client = engine.app.test_client()
+
+    r = client.post(
+        "/tv-webhook",
+        data=b'{"signal": "CHECK", "qty": 1}',
+        headers={"X-Signature": "é" * 64},
+    )
+    assert r.status_code == 401
@@ -0,0 +1,27 @@
+import time
+
+import app as engine
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_data_429_does_not_delay_order_placement(monkeypatch):
+    monkeypatch.setattr(engine, "DHAN_BACKOFF_UNTIL", {"orders": 0.0, "data": 0.0})
+    monkeypatch.setattr(engine, "dhan_headers", lambda: {})
+
+    responses = iter([FakeResponse(429, {"Retry-After": "5"}), FakeResponse(200)])
+    monkeypatch.setattr(
+        engine.SESSION, "request", lambda method, url, **kwargs: next(responses)
+    )
+
+    engine.dhan_request("POST", engine.DHAN_OPTION_CHAIN_URL, json={})
+    assert engine.DHAN_BACKOFF_UNTIL["data"] > time.monotonic()
+
+    start = time.monotonic()
+    r = engine.dhan_request("POST", engine.DHAN_ORDERS_URL, data=b"{}")
+    assert r.status_code == 200
+    assert time.monotonic() - start < 1
@@ -0,0 +1,18 @@
+import threading
+from datetime import datetime
+
+import app as engine
+
+
+def test_import_does_not_start_keepalive():
+    assert "dhan-keepalive" not in [t.name for t in threading.enumerate()]
+
+
+def test_keepalive_only_during_market_hours():
+    monday_open = datetime(2026, 10, 12, 10, 0, tzinfo=engine.IST)
+    monday_night = datetime(2026, 10, 12, 22, 0, tzinfo=engine.IST)
+    saturday_open = datetime(2026, 10, 17, 10, 0, tzinfo=engine.IST)
+
+    assert engine.within_keepalive_hours(monday_open)
+    assert not engine.within_keepalive_hours(monday_night)
+    assert not engine.within_keepalive_hours(saturday_open)
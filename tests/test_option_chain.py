@@ -0,0 +1,33 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app as engine
+
+
+class FakeResponse:
+    ok = True
+    status_code = 200
+    content = b'{"data": {"last_price": 25000, "oc": {"25000.000000": {}}}}'
+
+
+def test_concurrent_callers_share_one_chain_refresh(monkeypatch):
+    monkeypatch.setenv("NIFTY_UNDERLYING_ID", "13")
+    monkeypatch.setattr(engine, "OPTION_CHAIN_CACHE", {})
+    monkeypatch.setattr(engine, "OPTION_CHAIN_LOCKS", {})
+
+    calls = []
+
+    def fake_request(method, url, **kwargs):
+        calls.append(url)
+        time.sleep(0.2)
+        return FakeResponse()
+
+    monkeypatch.setattr(engine, "dhan_request", fake_request)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(
+            engine.fetch_option_chain_for_expiry, ["2099-01-29"] * 4
+        ))
+
+    assert len(calls) == 1
+    assert all(r == (25000.0, {25000: {}}) for r in results)
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+import app as engine
+
+
+@pytest.fixture
+def observer_threads(monkeypatch):
+    """
+    Capture the observer's thread so tests can join it instead of sleeping
+    """
+    threads = []
+
+    class RecordingThread(threading.Thread):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            threads.append(self)
+
+    monkeypatch.setattr(engine, "Thread", RecordingThread)
+    return threads
+
+
+def test_silent_postback_polls_at_most_max_polls(monkeypatch, observer_threads):
+    polls = []
+    monkeypatch.setattr(
+        engine, "get_order_status", lambda order_id: polls.append(order_id) or "PENDING"
+    )
+
+    engine.observe_order_status_async("silent-1", "TEST", window=0.5, max_interval=0.01)
+    observer_threads[0].join(timeout=5)
+
+    assert not observer_threads[0].is_alive()
+    assert len(polls) == engine.ORDER_POLL_MAX
+    assert "silent-1" not in engine.ORDER_EVENTS
+
+
+def test_postback_stops_observer_without_polling(monkeypatch, observer_threads):
+    polls = []
+    monkeypatch.setattr(
+        engine, "get_order_status", lambda order_id: polls.append(order_id) or "PENDING"
+    )
+
+    engine.record_order_update("fast-1", {"orderId": "fast-1", "orderStatus": "TRADED"})
+    engine.observe_order_status_async("fast-1", "TEST")
+    observer_threads[0].join(timeout=5)
+
+    assert not observer_threads[0].is_alive()
+    assert polls == []
+    assert "fast-1" not in engine.ORDER_EVENTS
+
+
+def test_postback_wakes_observer_mid_wait(monkeypatch, observer_threads):
+    first_poll = threading.Event()
+
+    def fake_status(order_id):
+        first_poll.set()
+        return "PENDING"
+
+    monkeypatch.setattr(engine, "get_order_status", fake_status)
+
+    engine.observe_order_status_async("late-1", "TEST", window=30, max_interval=5)
+    assert first_poll.wait(timeout=5)
+    engine.record_order_update("late-1", {"orderId": "late-1", "orderStatus": "TRADED"})
+    observer_threads[0].join(timeout=5)
+
+    assert not observer_threads[0].is_alive()
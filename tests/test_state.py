@@ -0,0 +1,27 @@
+import app as engine
+
+
+def test_state_is_on_disk_when_persist_returns(monkeypatch, tmp_path):
+    monkeypatch.setattr(engine, "STATE_FILE", str(tmp_path / "state.json"))
+    monkeypatch.setattr(engine, "SYSTEM_POSITIONS", {})
+
+    engine.persist_system_state("S1", {"qty": 75, "expiry": "2099-01-29"})
+    assert engine.load_system_positions() == {
+        "S1": {"qty": 75, "expiry": "2099-01-29"}
+    }
+
+    engine.remove_system_state("S1")
+    assert engine.load_system_positions() == {}
+
+
+def test_non_str_system_id_does_not_break_saves(monkeypatch, tmp_path):
+    monkeypatch.setattr(engine, "STATE_FILE", str(tmp_path / "state.json"))
+    monkeypatch.setattr(engine, "SYSTEM_POSITIONS", {})
+
+    engine.persist_system_state(1, {"qty": 75, "expiry": "2099-01-29"})
+    engine.persist_system_state("S2", {"qty": 50, "expiry": "2099-01-29"})
+
+    assert engine.load_system_positions() == {
+        "1": {"qty": 75, "expiry": "2099-01-29"},
+        "S2": {"qty": 50, "expiry": "2099-01-29"},
+    }
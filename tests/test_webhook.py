@@ -0,0 +1,86 @@
+import pytest
+
+import app as engine
+
+
+class InlineExecutor:
+    """
+    Runs submitted work synchronously so the test sees its effects
+    """
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(engine, "STATE_FILE", str(tmp_path / "state.json"))
+    monkeypatch.setattr(engine, "WEBHOOK_SECRET", b"")
+    monkeypatch.setattr(engine, "EXECUTOR", InlineExecutor())
+    monkeypatch.setattr(engine, "SYSTEM_POSITIONS", {})
+    monkeypatch.setattr(engine, "PENDING_ENTRIES", {})
+    monkeypatch.setattr(engine, "ALERT_DEDUPE", {})
+    return engine.app.test_client()
+
+
+def test_identical_buy_sell_buy_all_dispatched(client, monkeypatch):
+    entries, exits = [], []
+
+    def fake_enter(system_id, underlying_id, qty):
+        entries.append(system_id)
+        engine.SYSTEM_POSITIONS[system_id] = {"qty": qty, "expiry": "2099-01-01"}
+        engine.PENDING_ENTRIES.pop(system_id, None)
+
+    def fake_exit(system_id):
+        exits.append(system_id)
+        engine.SYSTEM_POSITIONS.pop(system_id, None)
+
+    monkeypatch.setattr(engine, "delayed_enter_synthetic", fake_enter)
+    monkeypatch.setattr(engine, "delayed_exit_synthetic", fake_exit)
+
+    buy = {"signal": "BUY", "system_id": "S1", "qty": 75}
+    sell = {"signal": "SELL", "system_id": "S1", "qty": 75}
+
+    assert client.post("/tv-webhook", json=buy).status_code == 202
+    assert client.post("/tv-webhook", json=sell).status_code == 202
+    assert client.post("/tv-webhook", json=buy).status_code == 202
+
+    assert entries == ["S1", "S1"]
+    assert exits == ["S1"]
+
+
+def test_retry_with_alert_id_is_replayed(client, monkeypatch):
+    entries = []
+    monkeypatch.setattr(
+        engine, "delayed_enter_synthetic",
+        lambda system_id, underlying_id, qty: entries.append(system_id)
+    )
+
+    buy = {"signal": "BUY", "system_id": "S1", "qty": 75, "alert_id": "a-1"}
+
+    first = client.post("/tv-webhook", json=buy)
+    engine.PENDING_ENTRIES.clear()
+    retry = client.post("/tv-webhook", json=buy)
+
+    assert first.status_code == retry.status_code == 202
+    assert retry.get_json() == first.get_json()
+    assert entries == ["S1"]
+
+
+@pytest.mark.parametrize("signal", ["BUY", "SELL", "EXIT"])
+@pytest.mark.parametrize("system_id", [None, 1, "", "  "])
+def test_trade_signals_require_str_system_id(client, signal, system_id):
+    alert = {"signal": signal, "qty": 75}
+    if system_id is not None:
+        alert["system_id"] = system_id
+
+    r = client.post("/tv-webhook", json=alert)
+    assert r.status_code == 400
+    assert engine.PENDING_ENTRIES == {}
+    assert engine.SYSTEM_POSITIONS == {}
+
+
+def test_check_signal_needs_no_system_id(client, monkeypatch):
+    monkeypatch.setattr(engine, "delayed_handle_rollover", lambda: None)
+
+    r = client.post("/tv-webhook", json={"signal": "CHECK", "qty": 1})
+    assert r.status_code == 202